@@ -191,13 +191,12 @@ class PanelHandlerCog(commands.Cog, name="Panel Handler"):
 
             elif action == 'reset_stuck_review':
                 try:
-                    conn = await database.get_db_connection()
-                    async with conn.cursor() as cursor:
-                        await cursor.execute(
-                            "SELECT submission_id, user_id FROM music_submissions WHERE guild_id = ? AND status = 'reviewing' AND submission_type = 'regular' LIMIT 1",
-                            (guild.id,)
+                    async with database.get_conn() as conn:
+                        rows = await conn.execute_fetchall(
+                            "SELECT submission_id, user_id FROM music_submissions WHERE guild_id = ? AND status = ? AND submission_type = ? LIMIT 1",
+                            (guild.id, database.SubmissionStatus.REVIEWING, database.SubmissionType.REGULAR)
                         )
-                        stuck_submission = await cursor.fetchone()
+                    stuck_submission = rows[0] if rows else None
 
                     if not stuck_submission:
                         log.info(f"Panel action 'reset_stuck_review' found no stuck submissions for guild {guild.id}.")
@@ -205,7 +204,7 @@ class PanelHandlerCog(commands.Cog, name="Panel Handler"):
                         return
 
                     submission_id, user_id = stuck_submission
-                    await database.update_submission_status(submission_id, "pending", None)
+                    await database.update_submission_status(submission_id, database.SubmissionStatus.PENDING, None)
                     
                     log.info(f"Panel action by {moderator_id} manually reset stuck submission {submission_id}.")
 
@@ -223,6 +222,10 @@ class PanelHandlerCog(commands.Cog, name="Panel Handler"):
             log.error(f"Error processing action queue: {e}", exc_info=True)
             if 'task' in locals() and hasattr(self.bot, 'action_queue') and not self.bot.action_queue.empty():
                 self.bot.action_queue.task_done()
+        finally:
+            # The action has now run (or bailed out), so the next audit log fetch must see its entries.
+            if 'task' in locals():
+                self.bot.audit_log_cache.pop(task.get('guild_id'), None)
 
     @process_action_queue.before_loop
     async def before_process_action_queue(self):
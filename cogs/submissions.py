@@ -39,7 +39,7 @@ class ReviewItemView(discord.ui.View):
     async def on_timeout(self):
         """Called when the view's 5-hour timer expires."""
         log.warning(f"Review for submission {self.submission_id} timed out.")
-        await database.update_submission_status(self.submission_id, "pending", None)
+        await database.update_submission_status(self.submission_id, database.SubmissionStatus.PENDING, None)
         
         guild = self.bot.get_guild(self.guild_id)
         if guild:
@@ -55,7 +55,7 @@ class ReviewItemView(discord.ui.View):
         if not self.cog: self.cog = self.bot.get_cog("Submissions")
         self.cog.regular_session_reviewed_count[interaction.guild.id] += 1
 
-        await database.update_submission_status(self.submission_id, "reviewed", interaction.user.id)
+        await database.update_submission_status(self.submission_id, database.SubmissionStatus.REVIEWED, interaction.user.id)
 
         self.stop()
 
@@ -93,11 +93,11 @@ class SubmissionBaseView(discord.ui.View):
 
         async def callback(self, interaction: discord.Interaction):
             if not await utils.has_mod_role(interaction.user): return await interaction.response.send_message("❌ Mods/Admins only.", ephemeral=True)
-            next_track = await database.get_next_submission(interaction.guild.id, submission_type='regular')
+            next_track = await database.get_next_submission(interaction.guild.id, database.SubmissionType.REGULAR)
             if not next_track: return await interaction.response.send_message("The submission queue is empty!", ephemeral=True)
             
             sub_id, user_id, url = next_track
-            await database.update_submission_status(sub_id, "reviewing", interaction.user.id)
+            await database.update_submission_status(sub_id, database.SubmissionStatus.REVIEWING, interaction.user.id)
             user = interaction.guild.get_member(user_id)
             embed = discord.Embed(title="🎵 Track for Review", description=f"Submitted by: {user.mention if user else 'N/A'}", color=config.BOT_CONFIG["EMBED_COLORS"]["INFO"])
             view = ReviewItemView(self.view.bot, sub_id, interaction.guild.id)
@@ -112,7 +112,9 @@ class SubmissionBaseView(discord.ui.View):
             if not await utils.has_admin_role(interaction.user): return await interaction.response.send_message("❌ Admins only.", ephemeral=True)
             await interaction.response.defer()
             session_reviewed_count = self.view.cog.regular_session_reviewed_count.get(interaction.guild.id, 0)
-            await database.clear_session_submissions(interaction.guild.id, 'regular')
+            await database.clear_session_submissions(interaction.guild.id, database.SubmissionType.REGULAR)
+            # The clear is queued; the panel refresh below re-reads the queue, so wait for it to commit.
+            await database.flush_writes()
             await database.update_setting(interaction.guild.id, 'submission_status', 'closed')
             await self.view._update_panel(interaction)
             sub_channel_id = await database.get_setting(interaction.guild.id, 'submission_channel_id')
@@ -127,7 +129,7 @@ class SubmissionBaseView(discord.ui.View):
         async def callback(self, interaction: discord.Interaction):
             if not await utils.has_mod_role(interaction.user): return await interaction.response.send_message("❌ Mods/Admins only.", ephemeral=True)
             await interaction.response.defer(ephemeral=True)
-            reviewed_count = await database.get_total_reviewed_count(interaction.guild.id, 'regular')
+            reviewed_count = await database.get_total_reviewed_count(interaction.guild.id, database.SubmissionType.REGULAR)
             embed = discord.Embed(title="📊 Regular Submission Statistics (All-Time)", description=f"A total of **{reviewed_count}** tracks have been permanently reviewed in this server.", color=config.BOT_CONFIG["EMBED_COLORS"]["INFO"])
             await interaction.followup.send(embed=embed)
 
@@ -221,9 +223,9 @@ class SubmissionsCog(commands.Cog, name="Submissions"):
 
         submission_type = None
         if status == 'open' and message.channel.id == submission_channel_id:
-            submission_type = 'regular'
+            submission_type = database.SubmissionType.REGULAR
 
-        if submission_type and message.attachments:
+        if submission_type is not None and message.attachments:
             for attachment in message.attachments:
                 if attachment.content_type and attachment.content_type.startswith("audio/"):
                     submission_id = await database.add_submission(message.guild.id, message.author.id, attachment.url, submission_type)
@@ -237,8 +239,8 @@ class SubmissionsCog(commands.Cog, name="Submissions"):
 
                     await self._update_panel_after_submission(message.guild)
 
-                    if submission_type == 'regular':
-                        total_user_subs = await database.get_user_submission_count(message.guild.id, message.author.id, 'regular')
+                    if submission_type == database.SubmissionType.REGULAR:
+                        total_user_subs = await database.get_user_submission_count(message.guild.id, message.author.id, database.SubmissionType.REGULAR)
                         if total_user_subs == 1:
                             await database.prioritize_submission(submission_id)
                             log.info(f"Prioritized first-time submission from {message.author.id}")
@@ -217,6 +217,7 @@ class VerificationCog(commands.Cog, name="Verification"):
     @tasks.loop(seconds=15)
     async def check_verifications(self):
         completed_users = await database.get_completed_verifications()
+        handled_states = []
         for state, guild_id, user_id, verified_account in completed_users:
             guild = self.bot.get_guild(guild_id)
             if not guild: continue
@@ -237,13 +238,14 @@ class VerificationCog(commands.Cog, name="Verification"):
                         if guild.me.top_role > member_role and guild.me.top_role > unverified_role:
                             await member.add_roles(member_role, reason="OAuth Verification Success")
                             await member.remove_roles(unverified_role, reason="OAuth Verification Success")
-                            await database.delete_verification_link(state)
+                            handled_states.append(state)
                             await send_log_message(guild, member, f"OAuth ({verified_account})")
                         else:
                             log.error(f"Bot lacks permissions to manage roles in guild {guild.id}.")
-                            await database.delete_verification_link(state)
+                            handled_states.append(state)
                 except Exception as e:
                     log.error(f"Error granting roles via verification: {e}")
+        await database.delete_verification_links(handled_states)
 
     @check_verifications.before_loop
     async def before_check_verifications(self):
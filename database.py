@@ -1,38 +1,281 @@
 import aiosqlite
+import asyncio
 import logging
-from datetime import datetime
 import secrets
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from itertools import groupby
 from typing import Optional
 
 log = logging.getLogger(__name__)
 DB_FILE = "bot_database.db"
+CURRENT_SCHEMA_VERSION = 11
 db_conn = None
+# Set by close_database(); stops late callers from silently reopening connections nothing would close.
+_db_closed = False
+
+# sqlite3 keeps compiled statements in a per-connection LRU keyed by SQL text.
+# Sized to hold every distinct statement this module issues (including one
+# per guild_settings column) so hot-path queries are never re-prepared.
+# sqlite3 does not expose SQLITE_PREPARE_PERSISTENT, so these long-lived
+# statements share the lookaside allocator with one-off queries.
+STATEMENT_CACHE_SIZE = 256
+
+# WAL with synchronous=NORMAL only fsyncs on checkpoint, not on every commit.
+CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA journal_size_limit=6144000;
+    PRAGMA wal_autocheckpoint=1000;
+    PRAGMA foreign_keys=ON;
+"""
+
+# Module toggles are packed into guild_settings.feature_flags.
+FLAG_RANKING = 1 << 0
+FLAG_SUBMISSIONS = 1 << 1
+FLAG_TEMP_VC = 1 << 2
+FEATURE_FLAGS = {
+    'ranking_system_enabled': FLAG_RANKING,
+    'submissions_system_enabled': FLAG_SUBMISSIONS,
+    'temp_vc_system_enabled': FLAG_TEMP_VC,
+}
+DEFAULT_FEATURE_FLAGS = FLAG_RANKING | FLAG_SUBMISSIONS | FLAG_TEMP_VC
+
+# music_submissions.status and submission_type are stored as these integers.
+class SubmissionStatus(IntEnum):
+    PENDING = 0
+    REVIEWING = 1
+    REVIEWED = 2
+
+class SubmissionType(IntEnum):
+    REGULAR = 0
+
+# WAL lets readers run alongside the writer, so reads get their own connections.
+READ_POOL_SIZE = 8
+_read_pool: Optional[asyncio.Queue] = None
+_read_pool_lock: Optional[asyncio.Lock] = None
+
+async def _open_connection():
+    conn = await aiosqlite.connect(DB_FILE, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = aiosqlite.Row
+    await conn.executescript(CONNECTION_PRAGMAS)
+    return conn
 
 async def get_db_connection():
-    """Gets a connection to the SQLite database."""
+    """Gets the single writer connection to the SQLite database."""
     global db_conn
     if db_conn:
         return db_conn
+    if _db_closed:
+        raise RuntimeError("The database has been closed.")
     try:
-        db_conn = await aiosqlite.connect(DB_FILE)
-        await db_conn.execute("PRAGMA journal_mode=WAL;")
+        db_conn = await _open_connection()
         log.info("Successfully connected to the SQLite database.")
         return db_conn
     except Exception as e:
         log.critical(f"Could not connect to the SQLite database: {e}")
         return None
 
-async def initialize_database():
-    """Initializes and updates the database schema using PRAGMA user_version."""
+async def _get_read_pool() -> asyncio.Queue:
+    global _read_pool, _read_pool_lock
+    if _read_pool is not None:
+        return _read_pool
+    if _db_closed:
+        raise RuntimeError("The database has been closed.")
+    if _read_pool_lock is None:
+        _read_pool_lock = asyncio.Lock()
+    async with _read_pool_lock:
+        if _read_pool is None:
+            pool = asyncio.Queue()
+            for _ in range(READ_POOL_SIZE):
+                pool.put_nowait(await _open_connection())
+            _read_pool = pool
+            log.info(f"Opened {READ_POOL_SIZE} pooled read connections.")
+    return _read_pool
+
+# Read connection pinned to the current task by db_session(); get_conn() reuses it when set.
+_session_conn: ContextVar[Optional[aiosqlite.Connection]] = ContextVar("db_session_conn", default=None)
+
+@asynccontextmanager
+async def get_conn():
+    """Borrows a read connection from the pool for the duration of the block."""
+    conn = _session_conn.get()
+    if conn is not None:
+        yield conn
+        return
+    pool = await _get_read_pool()
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+
+@asynccontextmanager
+async def db_session():
+    """Pins one pooled read connection to the current task so a burst of reads skips the pool round trip.
+
+    Keep sessions short: the connection is unavailable to other tasks until the block exits.
+    """
+    if _session_conn.get() is not None:
+        yield _session_conn.get()
+        return
+    pool = await _get_read_pool()
+    conn = await pool.get()
+    token = _session_conn.set(conn)
+    try:
+        yield conn
+    finally:
+        _session_conn.reset(token)
+        pool.put_nowait(conn)
+
+async def close_database():
+    """Commits queued writes and closes every open connection."""
+    global db_conn, _read_pool, _db_closed, _writer_task
+    _db_closed = True
+    await flush_writes()
+    if _writer_task is not None:
+        _writer_task.cancel()
+        _writer_task = None
+    if _read_pool is not None:
+        while not _read_pool.empty():
+            await _read_pool.get_nowait().close()
+        _read_pool = None
+    if db_conn:
+        await db_conn.commit()
+        await db_conn.execute("PRAGMA optimize")
+        await db_conn.close()
+        db_conn = None
+
+WAL_CHECKPOINT_INTERVAL = 300
+
+async def checkpoint_wal():
+    """Copies the WAL back into the database file and truncates it so reads stay fast after write bursts."""
     conn = await get_db_connection()
     if not conn: return
-    
+    await flush_writes()
+    async with _get_write_lock():
+        async with conn.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+            busy, _, _ = await cursor.fetchone()
+    if busy:
+        log.debug("WAL checkpoint could not complete; readers were still active.")
+
+# SQLite caps bound parameters per statement (999 on older builds).
+IN_QUERY_CHUNK_SIZE = 900
+
+async def _chunked_in_query(conn, sql_template: str, ids, chunk_size: int = IN_QUERY_CHUNK_SIZE, params: tuple = ()):
+    """Runs a query with an `IN ({placeholders})` clause in batches so large id lists stay under SQLite's parameter limit."""
+    ids = list(ids)
+    results = []
+    for i in range(0, len(ids), chunk_size):
+        batch = ids[i:i + chunk_size]
+        sql = sql_template.format(placeholders=",".join("?" * len(batch)))
+        results.extend(await conn.execute_fetchall(sql, (*params, *batch)))
+    return results
+
+async def _scalar(sql: str, params: tuple = (), default=0):
+    """Runs a single-value query and returns its first column, or default when no row matches."""
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall(sql, params)
+    return rows[0][0] if rows else default
+
+# --- WRITE TRANSACTIONS ---
+# Every write on the shared writer connection runs inside one of these, so a failed transaction
+# can be rolled back without discarding, or committing, statements from any other caller.
+_write_lock: Optional[asyncio.Lock] = None
+
+def _get_write_lock() -> asyncio.Lock:
+    global _write_lock
+    if _write_lock is None:
+        _write_lock = asyncio.Lock()
+    return _write_lock
+
+@asynccontextmanager
+async def _write_transaction():
+    """Runs the block as one explicit transaction on the writer connection, rolled back if it raises."""
+    async with _get_write_lock():
+        conn = await get_db_connection()
+        await conn.execute("BEGIN")
+        try:
+            yield conn
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+
+# --- BACKGROUND WRITER ---
+# Writes that don't need to block their caller are queued here and committed in batches.
+_write_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
+def _enqueue_write(sql: str, params: tuple = (), wait: bool = True) -> Optional[asyncio.Future]:
+    """Queues a write for the background writer. Returns a future resolving once committed, or None if wait is False.
+
+    The future's result is the row's lastrowid, or None when the write was batched into an executemany with identical statements.
+    """
+    global _write_queue, _writer_task
+    if _db_closed:
+        raise RuntimeError("The database has been closed.")
+    if _write_queue is None:
+        _write_queue = asyncio.Queue()
+    if _writer_task is None or _writer_task.done():
+        _writer_task = asyncio.create_task(_writer_loop())
+    future = asyncio.get_running_loop().create_future() if wait else None
+    _write_queue.put_nowait((sql, params, future))
+    return future
+
+async def _writer_loop():
+    """Drains the write queue, running every pending statement before a single commit.
+
+    Consecutive writes with the same SQL are sent as one executemany, so a burst costs one hop to the connection thread instead of one per row.
+    """
+    while True:
+        batch = [await _write_queue.get()]
+        while not _write_queue.empty():
+            batch.append(_write_queue.get_nowait())
+        results = []
+        try:
+            async with _write_transaction() as conn:
+                for sql, group in groupby(batch, key=lambda item: item[0]):
+                    group = list(group)
+                    # executemany isn't atomic; the savepoint undoes a failed group's earlier rows without touching the rest of the batch.
+                    await conn.execute("SAVEPOINT write_group")
+                    try:
+                        if len(group) == 1:
+                            async with conn.execute(sql, group[0][1]) as cursor:
+                                rowid = cursor.lastrowid
+                        else:
+                            await conn.executemany(sql, [params for _, params, _ in group])
+                            rowid = None
+                        results.extend((future, rowid, None) for _, _, future in group)
+                    except Exception as e:
+                        log.error(f"Queued database write failed: {e}")
+                        await conn.execute("ROLLBACK TO write_group")
+                        results.extend((future, None, e) for _, _, future in group)
+                    await conn.execute("RELEASE write_group")
+        except Exception as e:
+            log.error(f"Failed to commit queued database writes: {e}")
+            results = [(future, None, error or e) for future, _, error in results]
+        for future, rowid, error in results:
+            if future and not future.done():
+                if error: future.set_exception(error)
+                else: future.set_result(rowid)
+        for _ in batch:
+            _write_queue.task_done()
+
+async def flush_writes():
+    """Waits until every queued write has been committed."""
+    if _write_queue is not None:
+        await _write_queue.join()
+
+async def _run_migrations(conn, current_version) -> int:
+    """Applies every schema migration newer than current_version and returns the new version."""
     async with conn.cursor() as cursor:
-        await cursor.execute("PRAGMA user_version")
-        current_version = (await cursor.fetchone())[0]
-        
-        log.info(f"Current database schema version: {current_version}")
-
         if current_version < 1:
             log.info("Running schema migration v1: Initial table creation...")
             await cursor.execute("""
@@ -103,271 +346,431 @@ async def initialize_database():
             except aiosqlite.OperationalError as e:
                 log.error(f"Failed to run schema v4 migration. Column might exist. Error: {e}")
 
-    await conn.commit()
+        if current_version < 5:
+            log.info("Running schema migration v5: Packing module toggles into feature_flags...")
+            try:
+                await cursor.execute(f"ALTER TABLE guild_settings ADD COLUMN feature_flags INTEGER NOT NULL DEFAULT {DEFAULT_FEATURE_FLAGS}")
+                await cursor.execute(f"""
+                    UPDATE guild_settings SET feature_flags =
+                        (CASE WHEN COALESCE(ranking_system_enabled, 1) THEN {FLAG_RANKING} ELSE 0 END)
+                        | (CASE WHEN COALESCE(submissions_system_enabled, 1) THEN {FLAG_SUBMISSIONS} ELSE 0 END)
+                        | (CASE WHEN COALESCE(temp_vc_system_enabled, 1) THEN {FLAG_TEMP_VC} ELSE 0 END)
+                """)
+                await cursor.execute("PRAGMA user_version = 5")
+                current_version = 5
+            except aiosqlite.OperationalError as e:
+                log.error(f"Failed to run schema v5 migration. Column might exist. Error: {e}")
+
+        if current_version < 6:
+            log.info("Running schema migration v6: Adding lookup indexes...")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_warn_guild_user ON warnings(guild_id, user_id, issued_at)")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sub_pending ON music_submissions(guild_id, submission_type, status, submitted_at)")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sub_user ON music_submissions(guild_id, user_id, submission_type, status)")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_gmail_fresh ON gmail_verification(guild_id, user_id, created_at)")
+            await cursor.execute("PRAGMA user_version = 6")
+            current_version = 6
+
+        if current_version < 7:
+            log.info("Running schema migration v7: Converting timestamps to Unix epochs...")
+            await cursor.execute("UPDATE warnings SET issued_at = CAST(strftime('%s', issued_at) AS INTEGER) WHERE typeof(issued_at) = 'text'")
+            await cursor.execute("UPDATE music_submissions SET submitted_at = CAST(strftime('%s', submitted_at) AS INTEGER) WHERE typeof(submitted_at) = 'text'")
+            await cursor.execute("UPDATE gmail_verification SET created_at = CAST(strftime('%s', created_at) AS INTEGER) WHERE typeof(created_at) = 'text'")
+            await cursor.execute("PRAGMA user_version = 7")
+            current_version = 7
+
+        if current_version < 8:
+            log.info("Running schema migration v8: Adding ranking xp index...")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_rank_guild_xp ON ranking(guild_id, xp DESC)")
+            await cursor.execute("PRAGMA user_version = 8")
+            current_version = 8
+
+        if current_version < 9:
+            log.info("Running schema migration v9: Adding submission priority...")
+            try:
+                await cursor.execute("ALTER TABLE music_submissions ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+                # Submissions prioritized before v9 had their submitted_at zeroed out.
+                await cursor.execute("UPDATE music_submissions SET priority = 1 WHERE submitted_at = 0")
+                await cursor.execute("DROP INDEX IF EXISTS idx_sub_pending")
+                await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sub_queue ON music_submissions(guild_id, submission_type, status, priority DESC, submitted_at ASC)")
+                await cursor.execute("PRAGMA user_version = 9")
+                current_version = 9
+            except aiosqlite.OperationalError as e:
+                log.error(f"Failed to run schema v9 migration. Column might exist. Error: {e}")
+
+        if current_version < 10:
+            log.info("Running schema migration v10: Moving staff roles into guild_role_sets...")
+            await cursor.execute("CREATE TABLE IF NOT EXISTS guild_role_sets (guild_id INTEGER NOT NULL, kind TEXT NOT NULL, role_id INTEGER NOT NULL, PRIMARY KEY (guild_id, kind, role_id)) WITHOUT ROWID")
+            await cursor.execute("SELECT guild_id, admin_role_ids, mod_role_ids FROM guild_settings")
+            role_rows = []
+            for guild_id, admin_ids, mod_ids in await cursor.fetchall():
+                role_rows += [(guild_id, 'admin', int(r)) for r in (admin_ids or "").split(',') if r]
+                role_rows += [(guild_id, 'mod', int(r)) for r in (mod_ids or "").split(',') if r]
+            await cursor.executemany("INSERT OR IGNORE INTO guild_role_sets (guild_id, kind, role_id) VALUES (?, ?, ?)", role_rows)
+            await cursor.execute("PRAGMA user_version = 10")
+            current_version = 10
+
+        if current_version < 11:
+            log.info("Running schema migration v11: Storing submission status and type as integers...")
+            await cursor.execute("CREATE TABLE music_submissions_v11 (submission_id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, track_url TEXT NOT NULL, status INTEGER NOT NULL, submitted_at INTEGER NOT NULL, reviewer_id INTEGER, submission_type INTEGER NOT NULL DEFAULT 0, priority INTEGER NOT NULL DEFAULT 0)")
+            await cursor.execute(f"""
+                INSERT INTO music_submissions_v11 (submission_id, guild_id, user_id, track_url, status, submitted_at, reviewer_id, submission_type, priority)
+                SELECT submission_id, guild_id, user_id, track_url,
+                    CASE status WHEN 'reviewing' THEN {SubmissionStatus.REVIEWING.value} WHEN 'reviewed' THEN {SubmissionStatus.REVIEWED.value} ELSE {SubmissionStatus.PENDING.value} END,
+                    submitted_at, reviewer_id, {SubmissionType.REGULAR.value}, priority
+                FROM music_submissions
+            """)
+            await cursor.execute("DROP TABLE music_submissions")
+            await cursor.execute("ALTER TABLE music_submissions_v11 RENAME TO music_submissions")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sub_user ON music_submissions(guild_id, user_id, submission_type, status)")
+            await cursor.execute("CREATE INDEX IF NOT EXISTS idx_sub_queue ON music_submissions(guild_id, submission_type, status, priority DESC, submitted_at ASC)")
+            await cursor.execute("PRAGMA user_version = 11")
+            current_version = 11
+    return current_version
+
+async def initialize_database():
+    """Initializes and updates the database schema using PRAGMA user_version."""
+    conn = await get_db_connection()
+    if not conn: return
+    await _get_read_pool()
+
+    async with conn.execute("PRAGMA user_version") as cursor:
+        current_version = (await cursor.fetchone())[0]
+
+    if current_version >= CURRENT_SCHEMA_VERSION:
+        log.info(f"Database schema is up to date (v{current_version}).")
+        await conn.execute("PRAGMA optimize")
+        return
+
+    log.info(f"Current database schema version: {current_version}")
+    # sqlite3 autocommits DDL outside an explicit transaction; one transaction keeps a crash mid-migration from leaving a half-applied schema.
+    async with _write_transaction() as conn:
+        current_version = await _run_migrations(conn, current_version)
+    await conn.execute("PRAGMA optimize")
     log.info(f"Database tables initialized/updated successfully. Now at schema v{current_version}.")
 
+# guild_id -> (loaded_at, settings row); event handlers read many settings per event.
+SETTINGS_CACHE_TTL = 60
+_settings_cache: dict[int, tuple[float, dict]] = {}
+# guild_id -> count of update_setting commits; a load only caches its row if no update landed while it was reading.
+_settings_generation: dict[int, int] = {}
+
+async def _load_settings(guild_id) -> dict:
+    """Returns the guild's settings row as a dict, served from a short-lived cache."""
+    now = time.monotonic()
+    cached = _settings_cache.get(guild_id)
+    if cached and now - cached[0] < SETTINGS_CACHE_TTL:
+        return cached[1]
+    generation = _settings_generation.get(guild_id, 0)
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT * FROM guild_settings WHERE guild_id = ?", (guild_id,))
+    settings = {}
+    if rows:
+        settings = dict(rows[0])
+        flags = settings.get('feature_flags', DEFAULT_FEATURE_FLAGS)
+        for name, flag in FEATURE_FLAGS.items():
+            settings[name] = int(bool(flags & flag))
+    if _settings_generation.get(guild_id, 0) == generation:
+        _settings_cache[guild_id] = (now, settings)
+    return settings
+
 async def get_setting(guild_id, setting_name):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute(f"SELECT {setting_name} FROM guild_settings WHERE guild_id = ?", (guild_id,))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    settings = await _load_settings(guild_id)
+    return settings.get(setting_name)
+
+# guild_settings columns that update_setting may write; column names cannot be bound as parameters.
+_SETTING_COLS = frozenset({
+    'verification_channel_id', 'unverified_role_id', 'member_role_id', 'verification_message_id',
+    'admin_role_ids', 'mod_role_ids', 'submission_channel_id', 'review_channel_id', 'submission_status',
+    'review_panel_message_id', 'announcement_channel_id', 'last_milestone_count', 'log_channel_id',
+    'temp_vc_hub_id', 'temp_vc_category_id', 'verification_mode', 'warning_limit', 'warning_action',
+    'warning_action_duration', 'free_verification_modes', 'role_giver_channel_id', 'role_giver_role_ids',
+    'role_giver_message_id',
+})
 
 async def update_setting(guild_id, setting_name, value):
-    conn = await get_db_connection()
-    sql = f"INSERT INTO guild_settings (guild_id, {setting_name}) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET {setting_name} = excluded.{setting_name}"
-    await conn.execute(sql, (guild_id, value))
-    await conn.commit()
+    if setting_name not in _SETTING_COLS and setting_name not in FEATURE_FLAGS:
+        raise ValueError(f"Unknown guild setting: {setting_name}")
+    async with _write_transaction() as conn:
+        if setting_name in FEATURE_FLAGS:
+            flag = FEATURE_FLAGS[setting_name]
+            bits = flag if value else 0
+            await conn.execute(
+                "INSERT INTO guild_settings (guild_id, feature_flags) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET feature_flags = (feature_flags & ~?) | ?",
+                (guild_id, (DEFAULT_FEATURE_FLAGS & ~flag) | bits, flag, bits)
+            )
+        else:
+            sql = f"INSERT INTO guild_settings (guild_id, {setting_name}) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET {setting_name} = excluded.{setting_name}"
+            await conn.execute(sql, (guild_id, value))
+            if setting_name in ROLE_SET_COLUMNS:
+                kind = ROLE_SET_COLUMNS[setting_name]
+                await conn.execute("DELETE FROM guild_role_sets WHERE guild_id = ? AND kind = ?", (guild_id, kind))
+                await conn.executemany("INSERT OR IGNORE INTO guild_role_sets (guild_id, kind, role_id) VALUES (?, ?, ?)", [(guild_id, kind, int(r)) for r in (value or "").split(',') if r])
+    # Invalidate only after the commit, so a read that could still see the old rows never caches them.
+    if setting_name in ROLE_SET_COLUMNS:
+        key = (guild_id, ROLE_SET_COLUMNS[setting_name])
+        _role_set_generation[key] = _role_set_generation.get(key, 0) + 1
+        _role_set_cache.pop(key, None)
+    _settings_generation[guild_id] = _settings_generation.get(guild_id, 0) + 1
+    _settings_cache.pop(guild_id, None)
 
 async def get_all_settings(guild_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT * FROM guild_settings WHERE guild_id = ?", (guild_id,))
-        row = await cursor.fetchone()
-        if not row: return {}
-        columns = [description[0] for description in cursor.description]
-        return dict(zip(columns, row))
+    return dict(await _load_settings(guild_id))
+
+# Comma-joined role columns mirrored into guild_role_sets, mapped to their kind.
+ROLE_SET_COLUMNS = {'admin_role_ids': 'admin', 'mod_role_ids': 'mod'}
+# (guild_id, kind) -> (loaded_at, role IDs); only update_setting writes these rows, so it invalidates exactly.
+# The TTL is a backstop in case an invalidation is ever missed.
+ROLE_SET_CACHE_TTL = 300
+_role_set_cache: dict[tuple[int, str], tuple[float, frozenset[int]]] = {}
+# (guild_id, kind) -> count of role set rewrites; a load only caches its result if none landed while it was reading.
+_role_set_generation: dict[tuple[int, str], int] = {}
+
+async def get_role_set(guild_id, kind) -> frozenset[int]:
+    """Returns the guild's role IDs of the given kind ('admin' or 'mod')."""
+    key = (guild_id, kind)
+    now = time.monotonic()
+    cached = _role_set_cache.get(key)
+    if cached and now - cached[0] < ROLE_SET_CACHE_TTL:
+        return cached[1]
+    generation = _role_set_generation.get(key, 0)
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT role_id FROM guild_role_sets WHERE guild_id = ? AND kind = ?", key)
+    role_ids = frozenset(row[0] for row in rows)
+    if _role_set_generation.get(key, 0) == generation:
+        _role_set_cache[key] = (now, role_ids)
+    return role_ids
 
 async def set_rank_reward(guild_id: int, rank_level: int, role_id: int):
-    conn = await get_db_connection()
-    await conn.execute("INSERT INTO rank_rewards (guild_id, rank_level, role_id) VALUES (?, ?, ?) ON CONFLICT(guild_id, rank_level) DO UPDATE SET role_id = excluded.role_id", (guild_id, rank_level, role_id))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("INSERT INTO rank_rewards (guild_id, rank_level, role_id) VALUES (?, ?, ?) ON CONFLICT(guild_id, rank_level) DO UPDATE SET role_id = excluded.role_id", (guild_id, rank_level, role_id))
+
+async def set_rank_rewards_bulk(guild_id: int, rewards: dict[int, int]):
+    """Sets many rank_level -> role_id rewards in one transaction."""
+    async with _write_transaction() as conn:
+        await conn.executemany("INSERT INTO rank_rewards (guild_id, rank_level, role_id) VALUES (?, ?, ?) ON CONFLICT(guild_id, rank_level) DO UPDATE SET role_id = excluded.role_id", [(guild_id, rank_level, role_id) for rank_level, role_id in rewards.items()])
 
 async def remove_rank_reward(guild_id: int, rank_level: int):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM rank_rewards WHERE guild_id = ? AND rank_level = ?", (guild_id, rank_level))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("DELETE FROM rank_rewards WHERE guild_id = ? AND rank_level = ?", (guild_id, rank_level))
 
 async def get_rank_reward(guild_id: int, rank_level: int):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT role_id FROM rank_rewards WHERE guild_id = ? AND rank_level = ?", (guild_id, rank_level))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    return await _scalar("SELECT role_id FROM rank_rewards WHERE guild_id = ? AND rank_level = ?", (guild_id, rank_level), default=None)
 
 async def get_all_rank_rewards(guild_id: int):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT rank_level, role_id FROM rank_rewards WHERE guild_id = ?", (guild_id,))
-        return await cursor.fetchall()
+    async with get_conn() as conn:
+        return await conn.execute_fetchall("SELECT rank_level, role_id FROM rank_rewards WHERE guild_id = ?", (guild_id,))
 
 # --- WARNINGS FUNCTIONS ---
 async def add_warning(guild_id, user_id, moderator_id, reason, log_message_id):
-    conn = await get_db_connection()
-    await conn.execute(
+    # Shares the write queue with clear_warnings so inserts can't overtake a pending clear.
+    await _enqueue_write(
         "INSERT INTO warnings (guild_id, user_id, moderator_id, reason, issued_at, log_message_id) VALUES (?, ?, ?, ?, ?, ?)",
-        (guild_id, user_id, moderator_id, reason, datetime.utcnow(), log_message_id)
+        (guild_id, user_id, moderator_id, reason, int(time.time()), log_message_id)
     )
-    await conn.commit()
+
+async def add_warnings_bulk(guild_id, rows):
+    """Inserts many warnings in one transaction. rows are (user_id, moderator_id, reason, log_message_id) tuples."""
+    await flush_writes()
+    now = int(time.time())
+    async with _write_transaction() as conn:
+        await conn.executemany(
+            "INSERT INTO warnings (guild_id, user_id, moderator_id, reason, issued_at, log_message_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [(guild_id, user_id, moderator_id, reason, now, log_message_id) for user_id, moderator_id, reason, log_message_id in rows]
+        )
 
 async def get_warnings(guild_id, user_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute(
+    async with get_conn() as conn:
+        return await conn.execute_fetchall(
             "SELECT moderator_id, reason, issued_at, warning_id FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY issued_at ASC",
             (guild_id, user_id)
         )
-        return await cursor.fetchall()
 
 async def get_warnings_count(guild_id, user_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT COUNT(*) FROM warnings WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+    return await _scalar("SELECT COUNT(*) FROM warnings WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
 
 async def clear_warnings(guild_id, user_id):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    await conn.commit()
+    _enqueue_write("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", (guild_id, user_id), wait=False)
 
 # --- TEMP VC FUNCTIONS ---
+# channel_id -> (owner_id, text_channel_id); mirrors the temporary_vcs table.
+_temp_vc_cache: dict[int, tuple[int, Optional[int]]] = {}
+
+async def load_temp_vc_cache():
+    """Loads every temporary VC into memory so voice-state lookups skip the database."""
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT channel_id, owner_id, text_channel_id FROM temporary_vcs")
+    _temp_vc_cache.clear()
+    _temp_vc_cache.update({channel_id: (owner_id, text_channel_id) for channel_id, owner_id, text_channel_id in rows})
+    log.info(f"Loaded {len(_temp_vc_cache)} temporary VCs into cache.")
+
 async def add_temp_vc(channel_id, owner_id, text_channel_id=None):
-    conn = await get_db_connection()
-    await conn.execute("INSERT OR REPLACE INTO temporary_vcs (channel_id, owner_id, text_channel_id) VALUES (?, ?, ?)", (channel_id, owner_id, text_channel_id))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("INSERT INTO temporary_vcs (channel_id, owner_id, text_channel_id) VALUES (?, ?, ?) ON CONFLICT(channel_id) DO UPDATE SET owner_id = excluded.owner_id, text_channel_id = excluded.text_channel_id", (channel_id, owner_id, text_channel_id))
+    _temp_vc_cache[channel_id] = (owner_id, text_channel_id)
 
 async def remove_temp_vc(channel_id):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM temporary_vcs WHERE channel_id = ?", (channel_id,))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("DELETE FROM temporary_vcs WHERE channel_id = ?", (channel_id,))
+    _temp_vc_cache.pop(channel_id, None)
 
 async def get_temp_vc_owner(channel_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT owner_id FROM temporary_vcs WHERE channel_id = ?", (channel_id,))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    entry = _temp_vc_cache.get(channel_id)
+    return entry[0] if entry else None
 
 async def get_temp_vc_text_channel_id(channel_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT text_channel_id FROM temporary_vcs WHERE channel_id = ?", (channel_id,))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    entry = _temp_vc_cache.get(channel_id)
+    return entry[1] if entry else None
 
 async def update_temp_vc_owner(channel_id, new_owner_id):
-    conn = await get_db_connection()
-    await conn.execute("UPDATE temporary_vcs SET owner_id = ? WHERE channel_id = ?", (new_owner_id, channel_id))
+    await _enqueue_write("UPDATE temporary_vcs SET owner_id = ? WHERE channel_id = ?", (new_owner_id, channel_id))
+    if channel_id in _temp_vc_cache:
+        _temp_vc_cache[channel_id] = (new_owner_id, _temp_vc_cache[channel_id][1])
 
 # --- SUBMISSION FUNCTIONS ---
-async def add_submission(guild_id, user_id, track_url, submission_type='regular'):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("INSERT INTO music_submissions (guild_id, user_id, track_url, status, submitted_at, submission_type) VALUES (?, ?, ?, ?, ?, ?)",(guild_id, user_id, track_url, "pending", datetime.utcnow(), submission_type))
-        submission_id = cursor.lastrowid
-    await conn.commit()
+async def add_submission(guild_id, user_id, track_url, submission_type=SubmissionType.REGULAR):
+    async with _write_transaction() as conn:
+        async with conn.execute("INSERT INTO music_submissions (guild_id, user_id, track_url, status, submitted_at, submission_type) VALUES (?, ?, ?, ?, ?, ?)",(guild_id, user_id, track_url, SubmissionStatus.PENDING, int(time.time()), submission_type)) as cursor:
+            submission_id = cursor.lastrowid
     return submission_id
 
-async def get_user_submission_count(guild_id, user_id, submission_type='regular'):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT COUNT(*) FROM music_submissions WHERE guild_id = ? AND user_id = ? AND submission_type = ?", (guild_id, user_id, submission_type))
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+async def get_user_submission_count(guild_id, user_id, submission_type=SubmissionType.REGULAR):
+    return await _scalar("SELECT COUNT(*) FROM music_submissions WHERE guild_id = ? AND user_id = ? AND submission_type = ?", (guild_id, user_id, submission_type))
 
-async def get_submission_queue_count(guild_id, submission_type='regular', status="pending"):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT COUNT(*) FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = ?", (guild_id, submission_type, status))
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+async def get_submission_queue_count(guild_id, submission_type=SubmissionType.REGULAR, status=SubmissionStatus.PENDING):
+    return await _scalar("SELECT COUNT(*) FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = ?", (guild_id, submission_type, status))
 
-async def get_total_reviewed_count(guild_id, submission_type='regular'):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT COUNT(DISTINCT submission_id) FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = 'reviewed'", (guild_id, submission_type))
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+async def get_total_reviewed_count(guild_id, submission_type=SubmissionType.REGULAR):
+    return await _scalar("SELECT COUNT(DISTINCT submission_id) FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = ?", (guild_id, submission_type, SubmissionStatus.REVIEWED))
         
-async def get_next_submission(guild_id, submission_type='regular'):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT submission_id, user_id, track_url FROM music_submissions WHERE guild_id = ? AND status = 'pending' AND submission_type = ? ORDER BY submitted_at ASC LIMIT 1", (guild_id, submission_type))
-        return await cursor.fetchone()
+async def get_next_submission(guild_id, submission_type=SubmissionType.REGULAR):
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT submission_id, user_id, track_url FROM music_submissions WHERE guild_id = ? AND status = ? AND submission_type = ? ORDER BY priority DESC, submitted_at ASC LIMIT 1", (guild_id, SubmissionStatus.PENDING, submission_type))
+    return rows[0] if rows else None
 
-async def update_submission_status(submission_id, status, reviewer_id=None):
-    conn = await get_db_connection()
-    await conn.execute("UPDATE music_submissions SET status = ?, reviewer_id = ? WHERE submission_id = ?", (status, reviewer_id, submission_id))
-    await conn.commit()
+async def update_submission_status(submission_id, status: SubmissionStatus, reviewer_id=None):
+    async with _write_transaction() as conn:
+        await conn.execute("UPDATE music_submissions SET status = ?, reviewer_id = ? WHERE submission_id = ?", (status, reviewer_id, submission_id))
 
-async def clear_session_submissions(guild_id, submission_type='regular'):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status != 'reviewed'", (guild_id, submission_type))
-    await conn.commit()
+async def clear_session_submissions(guild_id, submission_type=SubmissionType.REGULAR):
+    _enqueue_write("DELETE FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status != ?", (guild_id, submission_type, SubmissionStatus.REVIEWED), wait=False)
 
 async def prioritize_submission(submission_id):
-    conn = await get_db_connection()
-    await conn.execute("UPDATE music_submissions SET submitted_at = '1970-01-01 00:00:00' WHERE submission_id = ?", (submission_id,))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("UPDATE music_submissions SET priority = priority + 1 WHERE submission_id = ?", (submission_id,))
 
-async def get_latest_pending_submission_id(guild_id: int, user_id: int, submission_type: str = 'regular') -> int | None:
+async def get_latest_pending_submission_id(guild_id: int, user_id: int, submission_type: SubmissionType = SubmissionType.REGULAR) -> int | None:
     """Gets the ID of a user's most recent pending submission."""
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute(
-            "SELECT submission_id FROM music_submissions WHERE guild_id = ? AND user_id = ? AND status = 'pending' AND submission_type = ? ORDER BY submitted_at DESC LIMIT 1",
-            (guild_id, user_id, submission_type)
-        )
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    return await _scalar("SELECT submission_id FROM music_submissions WHERE guild_id = ? AND user_id = ? AND status = ? AND submission_type = ? ORDER BY submitted_at DESC LIMIT 1", (guild_id, user_id, SubmissionStatus.PENDING, submission_type), default=None)
+
+# (guild_id, user_id) -> XP gained since the last flush. Written out by flush_xp().
+XP_FLUSH_INTERVAL = 5
+_xp_pending: defaultdict[tuple[int, int], int] = defaultdict(int)
+# Serializes flushes; two overlapping flushes would both write the same snapshot.
+_xp_flush_lock: Optional[asyncio.Lock] = None
 
 async def get_user_xp(guild_id, user_id):
-    """Gets just the user's XP."""
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT xp FROM ranking WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-        result = await cursor.fetchone()
-        return result[0] if result else 0
+    """Gets just the user's XP, including gains that haven't been flushed yet."""
+    stored_xp = await _scalar("SELECT xp FROM ranking WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+    return stored_xp + _xp_pending.get((guild_id, user_id), 0)
 
 async def update_user_xp(guild_id, user_id, xp_to_add):
-    conn = await get_db_connection()
-    await conn.execute("INSERT INTO ranking (guild_id, user_id, xp) VALUES (?, ?, ?) ON CONFLICT(guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp", (guild_id, user_id, xp_to_add))
-    await conn.commit()
+    _xp_pending[(guild_id, user_id)] += xp_to_add
+
+async def flush_xp():
+    """Writes all buffered XP gains in a single transaction."""
+    global _xp_flush_lock
+    if _xp_flush_lock is None:
+        _xp_flush_lock = asyncio.Lock()
+    async with _xp_flush_lock:
+        await _flush_xp_locked()
+
+async def _flush_xp_locked():
+    if not _xp_pending: return
+    pending = list(_xp_pending.items())
+    try:
+        # Rolled back as a whole on failure, so the retained pending XP is never written twice.
+        async with _write_transaction() as conn:
+            await conn.executemany(
+                "INSERT INTO ranking (guild_id, user_id, xp) VALUES (?, ?, ?) ON CONFLICT(guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp",
+                [(guild_id, user_id, xp) for (guild_id, user_id), xp in pending]
+            )
+    except Exception as e:
+        log.error(f"Failed to flush {len(pending)} pending XP updates: {e}")
+        return
+    for key, xp in pending:
+        _xp_pending[key] -= xp
+        if not _xp_pending[key]:
+            del _xp_pending[key]
 
 async def get_user_rank(guild_id, user_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT xp FROM ranking WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-        result = await cursor.fetchone()
-        if not result: return None, None
-        user_xp = result[0]
-        await cursor.execute("SELECT COUNT(*) FROM ranking WHERE guild_id = ? AND xp > ?", (guild_id, user_xp))
-        rank_result = await cursor.fetchone()
-        rank = rank_result[0] + 1
-        return user_xp, rank
+    # Unflushed gains would otherwise leave a new user unranked until the next flush.
+    if (guild_id, user_id) in _xp_pending:
+        await flush_xp()
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT r.xp, (SELECT COUNT(*) + 1 FROM ranking WHERE guild_id = r.guild_id AND xp > r.xp) FROM ranking r WHERE r.guild_id = ? AND r.user_id = ?", (guild_id, user_id))
+    if not rows: return None, None
+    return rows[0][0], rows[0][1]
 
 async def get_leaderboard(guild_id, limit=10):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT user_id, xp FROM ranking WHERE guild_id = ? ORDER BY xp DESC LIMIT ?", (guild_id, limit))
-        return await cursor.fetchall()
+    async with get_conn() as conn:
+        return await conn.execute_fetchall("SELECT user_id, xp FROM ranking WHERE guild_id = ? ORDER BY xp DESC LIMIT ?", (guild_id, limit))
 
 async def create_verification_link(state, guild_id, user_id, server_name, bot_avatar_url):
-    conn = await get_db_connection()
-    await conn.execute("INSERT INTO verification_links (state, guild_id, user_id, server_name, bot_avatar_url) VALUES (?, ?, ?, ?, ?)", (state, guild_id, user_id, server_name, bot_avatar_url))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("INSERT INTO verification_links (state, guild_id, user_id, server_name, bot_avatar_url) VALUES (?, ?, ?, ?, ?) ON CONFLICT(state) DO NOTHING", (state, guild_id, user_id, server_name, bot_avatar_url))
+
+async def get_verification_link_info(state):
+    """Gets the (server_name, bot_avatar_url) shown on a verification page, or None for an unknown state."""
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall("SELECT server_name, bot_avatar_url FROM verification_links WHERE state = ?", (state,))
+    return rows[0] if rows else None
 
 async def complete_verification(state, account_name):
-    conn = await get_db_connection()
-    await conn.execute("UPDATE verification_links SET status = 'verified', verified_account = ? WHERE state = ?", (account_name, state))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("UPDATE verification_links SET status = 'verified', verified_account = ? WHERE state = ? AND status = 'pending'", (account_name, state))
 
 async def get_completed_verifications():
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT state, guild_id, user_id, verified_account FROM verification_links WHERE status = 'verified'")
-        return await cursor.fetchall()
+    async with get_conn() as conn:
+        return await conn.execute_fetchall("SELECT state, guild_id, user_id, verified_account FROM verification_links WHERE status = 'verified'")
 
-async def delete_verification_link(state):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM verification_links WHERE state = ?", (state,))
-    await conn.commit()
+async def delete_verification_links(states):
+    """Deletes every given verification link in a single transaction."""
+    if not states: return
+    async with _write_transaction() as conn:
+        await conn.executemany("DELETE FROM verification_links WHERE state = ?", [(state,) for state in states])
+
+# Seconds a mailed verification code stays valid.
+GMAIL_CODE_TTL = 600
 
 async def store_gmail_code(guild_id, user_id, code):
-    conn = await get_db_connection()
-    await conn.execute("INSERT INTO gmail_verification (guild_id, user_id, verification_code) VALUES (?, ?, ?) ON CONFLICT(guild_id, user_id) DO UPDATE SET verification_code = excluded.verification_code, created_at = CURRENT_TIMESTAMP", (guild_id, user_id, code))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("INSERT INTO gmail_verification (guild_id, user_id, verification_code, created_at) VALUES (?, ?, ?, ?) ON CONFLICT(guild_id, user_id) DO UPDATE SET verification_code = excluded.verification_code, created_at = excluded.created_at", (guild_id, user_id, code, int(time.time())))
 
 async def get_gmail_code(guild_id, user_id):
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT verification_code FROM gmail_verification WHERE guild_id = ? AND user_id = ? AND created_at > datetime('now', '-10 minutes')", (guild_id, user_id))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    return await _scalar("SELECT verification_code FROM gmail_verification WHERE guild_id = ? AND user_id = ? AND created_at > ?", (guild_id, user_id, int(time.time()) - GMAIL_CODE_TTL), default=None)
 
 async def delete_gmail_code(guild_id, user_id):
-    conn = await get_db_connection()
-    await conn.execute("DELETE FROM gmail_verification WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    await conn.commit()
+    async with _write_transaction() as conn:
+        await conn.execute("DELETE FROM gmail_verification WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
 
 async def get_or_create_widget_token(guild_id: int) -> str:
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT token FROM widget_tokens WHERE guild_id = ?", (guild_id,))
-        result = await cursor.fetchone()
-        if result:
-            return result[0]
-        else:
-            token = secrets.token_urlsafe(32)
-            await cursor.execute("INSERT INTO widget_tokens (token, guild_id) VALUES (?, ?)", (token, guild_id))
-            await conn.commit()
-            return token
+    existing_token = await _scalar("SELECT token FROM widget_tokens WHERE guild_id = ?", (guild_id,), default=None)
+    if existing_token:
+        return existing_token
+    # A concurrent caller may have created the token since the read; the no-op update makes RETURNING yield the stored one.
+    async with _write_transaction() as conn:
+        async with conn.execute("INSERT INTO widget_tokens (token, guild_id) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET guild_id = guild_id RETURNING token", (secrets.token_urlsafe(32), guild_id)) as cursor:
+            token = (await cursor.fetchone())[0]
+    return token
 
 async def get_guild_from_token(token: str) -> Optional[int]:
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute("SELECT guild_id FROM widget_tokens WHERE token = ?", (token,))
-        result = await cursor.fetchone()
-        return result[0] if result else None
+    return await _scalar("SELECT guild_id FROM widget_tokens WHERE token = ?", (token,), default=None)
     
-async def get_current_review(guild_id: int, submission_type: str = 'regular'):
-    """Gets the user_id of the submission currently being reviewed."""
-    conn = await get_db_connection()
-    async with conn.cursor() as cursor:
-        await cursor.execute(
-            "SELECT user_id FROM music_submissions WHERE guild_id = ? AND status = 'reviewing' AND submission_type = ? ORDER BY submitted_at ASC LIMIT 1",
-            (guild_id, submission_type)
+async def get_widget_bundle(guild_id: int, submission_type: SubmissionType = SubmissionType.REGULAR):
+    """Gets (pending_count, reviewing_user_id) for the stream widget in one query."""
+    async with get_conn() as conn:
+        rows = await conn.execute_fetchall(
+            "SELECT (SELECT COUNT(*) FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = ?), (SELECT user_id FROM music_submissions WHERE guild_id = ? AND submission_type = ? AND status = ? ORDER BY priority DESC, submitted_at ASC LIMIT 1)",
+            (guild_id, submission_type, SubmissionStatus.PENDING, guild_id, submission_type, SubmissionStatus.REVIEWING)
         )
-        result = await cursor.fetchone()
-        return result[0] if result else None
\ No newline at end of file
+    return rows[0][0], rows[0][1]
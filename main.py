@@ -7,6 +7,7 @@ load_dotenv()
 
 import discord
 from discord.ext import commands
+from cachetools import TTLCache
 
 import database
 import config
@@ -30,6 +31,10 @@ class MyBot(commands.Bot):
     def __init__(self, *, intents: discord.Intents):
         super().__init__(command_prefix="!", intents=intents)
         self.action_queue = asyncio.Queue()
+        # Caps concurrent web-side database calls so bot events always find a free reader in the pool.
+        self.db_web_sem = asyncio.Semaphore(4)
+        # guild_id -> serialized audit log JSON for the web panel; PanelHandler drops a guild's entry once it has run an action there.
+        self.audit_log_cache = TTLCache(maxsize=128, ttl=10)
 
     async def setup_hook(self):
 
@@ -40,6 +45,9 @@ class MyBot(commands.Bot):
         log.info(f"Started background web server task on port {port}.")
         
         await database.initialize_database()
+        await database.load_temp_vc_cache()
+        self.loop.create_task(self._xp_flush_loop())
+        self.loop.create_task(self._wal_checkpoint_loop())
         
         self.add_view(VerificationButton(bot=self))
         self.add_view(RoleGiverView(bot=self))
@@ -64,6 +72,29 @@ class MyBot(commands.Bot):
         synced = await self.tree.sync()
         log.info(f"Synced {len(synced)} commands globally.")
         
+    async def _xp_flush_loop(self):
+        """Periodically writes buffered XP gains to the database."""
+        while not self.is_closed():
+            await asyncio.sleep(database.XP_FLUSH_INTERVAL)
+            await database.flush_xp()
+
+    async def _wal_checkpoint_loop(self):
+        """Periodically truncates the database WAL file."""
+        while not self.is_closed():
+            await asyncio.sleep(database.WAL_CHECKPOINT_INTERVAL)
+            try:
+                await database.checkpoint_wal()
+            except Exception as e:
+                log.error(f"WAL checkpoint failed: {e}")
+
+    async def close(self):
+        # Stop the gateway and background loops first so nothing queues writes behind the final flush.
+        try:
+            await super().close()
+        finally:
+            await database.flush_xp()
+            await database.close_database()
+
     async def on_ready(self):
         log.info(f"Logged in as {self.user} (ID: {self.user.id})")
         log.info("Bot is ready! 🚀")
@@ -1,18 +1,17 @@
-from quart import Quart, request, render_template, websocket, redirect, url_for, jsonify, session, abort
+from quart import Quart, Response, request, render_template, websocket, redirect, url_for, session, abort, make_response
 import discord
 import os
 import httpx
-import aiosqlite
 from dotenv import load_dotenv
 import asyncio
 import logging
-import json
+import orjson
 import utils
-from collections import defaultdict
 from urllib.parse import urlencode
-import time
+from cachetools import TTLCache
 import config
 import secrets
+import hashlib
 
 import database
 from cogs.ranking import get_rank_info
@@ -22,12 +21,15 @@ from cogs.submissions import get_panel_embed_and_view
 app = Quart(__name__, static_folder='static', static_url_path='/static', template_folder='web')
 log = logging.getLogger(__name__)
 
-user_cache = {}
-cache_lock = asyncio.Lock()
 CACHE_DURATION_SECONDS = 300
+user_cache = TTLCache(maxsize=10000, ttl=CACHE_DURATION_SECONDS)
+# user_id -> future for a lookup already in progress, so concurrent misses share one API call.
+user_fetches_inflight: dict[int, asyncio.Future] = {}
+# Caps concurrent Discord API lookups when a cold leaderboard misses both caches.
+user_fetch_sem = asyncio.Semaphore(10)
 
-web_cache = {}
 CACHE_EXPIRATION = 120
+web_cache = TTLCache(maxsize=256, ttl=CACHE_EXPIRATION)
 
 APP_ENV = config.APP_ENV
 APP_BASE_URL = config.APP_BASE_URL
@@ -37,19 +39,33 @@ app.secret_key = config.QUART_SECRET_KEY
 
 GOOGLE_CLIENT_ID = config.GOOGLE_CLIENT_ID
 GOOGLE_CLIENT_SECRET = config.GOOGLE_CLIENT_SECRET
-DB_FILE = "bot_database.db"
 
 DISCORD_REDIRECT_URI = f"{config.APP_BASE_URL}/callback"
 DISCORD_API_BASE_URL = "https://discord.com/api"
 GOOGLE_REDIRECT_URI = f"{config.APP_BASE_URL}/callback/google"
 
 from functools import wraps
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+@app.before_serving
+async def open_http_client():
+    # One pooled client keeps TLS sessions to the OAuth providers alive between callbacks.
+    app.http_client = httpx.AsyncClient(http2=True, limits=httpx.Limits(max_keepalive_connections=20), timeout=10.0)
+
+@app.after_serving
+async def close_http_client():
+    await app.http_client.aclose()
+
+def _json(obj, status: int = 200) -> Response:
+    """Serializes an API response with orjson, which emits compact output."""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
 
 def login_required(f):
     @wraps(f)
     async def decorated_function(guild_id: int, *args, **kwargs):
         user_id = session.get('user_id')
-        authorized_guilds = session.get('authorized_guilds', [])
+        authorized_guilds = frozenset(session.get('authorized_guilds') or ())
 
         if not user_id or guild_id not in authorized_guilds:
             session['login_redirect_guild_id'] = guild_id
@@ -65,77 +81,117 @@ def login_required(f):
         return await f(guild_id, *args, **kwargs)
     return decorated_function
 
+# Messages broadcast within this window reach each client as one JSON array frame.
+WS_COALESCE_SECONDS = 0.02
+
 class WebSocketManager:
     def __init__(self):
-        self.active_connections: dict[int, set] = defaultdict(set)
+        # guild_id -> {ws_conn: outgoing queue of serialized messages}
+        self.active_connections: dict[int, dict] = {}
+        self._writers: dict = {}
         log.info("WebSocketManager initialized.")
 
-    async def register(self, guild_id: int, ws_conn):
-        self.active_connections[guild_id].add(ws_conn)
+    async def register(self, guild_id: int, ws_conn, initial_message: dict):
+        """Adds a connection whose first frame is initial_message, ahead of any later broadcast."""
+        queue = asyncio.Queue()
+        queue.put_nowait(orjson.dumps(initial_message).decode())
+        self.active_connections.setdefault(guild_id, {})[ws_conn] = queue
+        self._writers[ws_conn] = asyncio.create_task(self._writer(guild_id, ws_conn, queue))
         log.info(f"New WebSocket connection registered for Guild ID: {guild_id}. Total: {len(self.active_connections[guild_id])}")
 
     async def unregister(self, guild_id: int, ws_conn):
-        if ws_conn in self.active_connections[guild_id]:
-            self.active_connections[guild_id].remove(ws_conn)
-            log.info(f"WebSocket connection unregistered for Guild ID: {guild_id}. Remaining: {len(self.active_connections[guild_id])}")
+        connections = self.active_connections.get(guild_id)
+        if connections and ws_conn in connections:
+            del connections[ws_conn]
+            if writer := self._writers.pop(ws_conn, None):
+                writer.cancel()
+            log.info(f"WebSocket connection unregistered for Guild ID: {guild_id}. Remaining: {len(connections)}")
+            if not connections:
+                del self.active_connections[guild_id]
 
     async def broadcast(self, guild_id: int, message: dict):
-        if guild_id in self.active_connections:
-            message_json = json.dumps(message)
-            connections = list(self.active_connections[guild_id])
-            for ws_conn in connections:
-                try:
-                    await ws_conn.send(message_json)
-                except Exception:
-                    pass
+        connections = self.active_connections.get(guild_id)
+        if not connections:
+            return
+        message_json = orjson.dumps(message).decode()
+        for queue in connections.values():
+            queue.put_nowait(message_json)
+
+    async def _writer(self, guild_id: int, ws_conn, queue: asyncio.Queue):
+        """Sends a connection's queued messages, coalescing each burst into a single frame."""
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(WS_COALESCE_SECONDS)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await ws_conn.send("[" + ",".join(batch) + "]")
+            except Exception:
+                # A dead connection must stop collecting broadcasts; pop ourselves first so unregister doesn't cancel this task.
+                self._writers.pop(ws_conn, None)
+                await self.unregister(guild_id, ws_conn)
+                return
     
 ws_manager = WebSocketManager()
 app.ws_manager = ws_manager
 
 async def get_verification_data(state: str):
     try:
-        async with aiosqlite.connect(DB_FILE) as conn:
-            async with conn.execute("SELECT server_name, bot_avatar_url FROM verification_links WHERE state = ?", (state,)) as cursor:
-                data = await cursor.fetchone()
-                if data: return {"server_name": data[0], "bot_avatar_url": data[1]}
-    except Exception as e:
-        print(f"Error fetching verification data: {e}")
+        async with app.bot_instance.db_web_sem:
+            data = await database.get_verification_link_info(state)
+        if data: return {"server_name": data[0], "bot_avatar_url": data[1]}
+    except Exception:
+        log.exception(f"Error fetching verification data for state {state}")
     return {"server_name": "your Discord server", "bot_avatar_url": ""}
 
 async def fetch_user_data(user_id: int):
     """Fetches user data from Discord API with caching."""
-    async with cache_lock:
-        current_time = asyncio.get_event_loop().time()
-        if user_id in user_cache and (current_time - user_cache[user_id]['timestamp']) < CACHE_DURATION_SECONDS:
-            return user_cache[user_id]['data']
+    if (cached := user_cache.get(user_id)) is not None:
+        return cached
+    if (inflight := user_fetches_inflight.get(user_id)) is not None:
+        data = await asyncio.shield(inflight)
+        # None means the leading request was cancelled; take over the fetch instead of failing with it.
+        return data if data is not None else await fetch_user_data(user_id)
+
+    future = asyncio.get_event_loop().create_future()
+    user_fetches_inflight[user_id] = future
+    try:
+        data = await _fetch_user_data_uncached(user_id)
+        future.set_result(data)
+        return data
+    except asyncio.CancelledError:
+        future.set_result(None)
+        raise
+    finally:
+        user_fetches_inflight.pop(user_id, None)
 
+async def _fetch_user_data_uncached(user_id: int):
     bot = app.bot_instance
     try:
-        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        user = bot.get_user(user_id)
+        if user is None:
+            async with user_fetch_sem:
+                user = await bot.fetch_user(user_id)
         if user:
             data = {"name": user.display_name, "avatar_url": user.display_avatar.url}
-            async with cache_lock:
-                user_cache[user_id] = {
-                    'data': data,
-                    'timestamp': asyncio.get_event_loop().time()
-                }
+            user_cache[user_id] = data
             return data
     except Exception as e:
         log.warning(f"Could not fetch user data for {user_id}: {e}")
 
     return {"name": "Unknown User", "avatar_url": "https://cdn.discordapp.com/embed/avatars/0.png"}
     
-async def is_valid_staff(guild_id, approver_name):
-    return approver_name is not None and approver_name != ""
+def is_valid_staff(guild_id, approver_name):
+    return bool(approver_name)
 
-async def get_full_widget_data(guild_id: int) -> dict:
+async def get_full_widget_data(guild_id: int, db_sem: asyncio.Semaphore | None = None) -> dict:
+    """Builds the widget's full_update message. Web callers pass db_sem, held for the database read only."""
     bot = app.bot_instance
     guild = bot.get_guild(guild_id)
     if not guild: return {}
 
-    status = await database.get_setting(guild_id, 'submission_status')
-    regular_queue_count = await database.get_submission_queue_count(guild_id, 'regular')
-    reviewing_user_id = await database.get_current_review(guild_id, 'regular')
+    async with db_sem or nullcontext():
+        regular_queue_count, reviewing_user_id = await database.get_widget_bundle(guild_id, database.SubmissionType.REGULAR)
 
     user_ids_to_fetch = set()
     if reviewing_user_id: user_ids_to_fetch.add(reviewing_user_id)
@@ -179,32 +235,64 @@ async def get_user_access_level(guild: discord.Guild, user_id: int) -> str:
         return "Moderator"
     return "Member"
 
-@app.route('/panel/<int:guild_id>')
-@login_required
-async def panel_home(guild_id: int):
-    """Renders the main dashboard page."""
+@dataclass
+class PanelCtx:
+    guild: discord.Guild
+    user_id: int
+    user_info: dict
+    access_level: str
+    is_developer: bool
+
+async def _panel_context(guild_id: int) -> PanelCtx:
+    """Resolves the guild and the logged-in user's profile and access level for a panel page."""
     guild = app.bot_instance.get_guild(guild_id)
     user_id = int(session.get('user_id'))
-    session_user_info = await fetch_user_data(user_id)
-    access_level = await get_user_access_level(guild, user_id)
-    is_dev = await utils.is_developer(user_id)
 
-    last_member_joined = sorted(guild.members, key=lambda m: m.joined_at, reverse=True)[0]
-    online_members = sum(1 for m in guild.members if m.status != discord.Status.offline)
-    
+    async def access_level_limited():
+        async with app.bot_instance.db_web_sem:
+            return await get_user_access_level(guild, user_id)
+
+    user_info, access_level = await asyncio.gather(fetch_user_data(user_id), access_level_limited())
+    return PanelCtx(guild, user_id, user_info, access_level, utils.is_developer(user_id))
+
+# guild_id -> (last member name, online count, member count); a few seconds stale is fine for the dashboard.
+dashboard_stats_cache = TTLCache(maxsize=64, ttl=5)
+
+def get_dashboard_member_stats(guild: discord.Guild) -> tuple[str, int, int]:
+    """Returns the dashboard's member stats, scanning the member list at most once per cache window."""
+    if (cached := dashboard_stats_cache.get(guild.id)) is not None:
+        return cached
+
+    # One pass over the member list for every dashboard stat.
+    last_member_joined = None
+    online_members = total_bots = 0
+    for m in guild.members:
+        if m.bot: total_bots += 1
+        if m.status != discord.Status.offline: online_members += 1
+        if m.joined_at and (last_member_joined is None or m.joined_at > last_member_joined.joined_at):
+            last_member_joined = m
+
     excluded_ids = set(config.BOT_CONFIG.get("MILESTONE_EXCLUDED_IDS", []))
-    total_bots = sum(1 for m in guild.members if m.bot)
     true_member_count = guild.member_count - total_bots - len(excluded_ids)
+    stats = (last_member_joined.display_name if last_member_joined else "N/A", online_members, true_member_count)
+    dashboard_stats_cache[guild.id] = stats
+    return stats
 
-    raw_leaderboard = await database.get_leaderboard(guild_id, limit=10)
+@app.route('/panel/<int:guild_id>')
+@login_required
+async def panel_home(guild_id: int):
+    """Renders the main dashboard page."""
+    ctx = await _panel_context(guild_id)
+    guild = ctx.guild
+    last_member, online_members, true_member_count = get_dashboard_member_stats(guild)
+
+    async with app.bot_instance.db_web_sem:
+        raw_leaderboard = await database.get_leaderboard(guild_id, limit=10)
     xp_leaderboard = []
     if raw_leaderboard:
-        user_ids = [user_id for user_id, xp in raw_leaderboard]
-        user_data_task = asyncio.gather(*[fetch_user_data(uid) for uid in user_ids])
-        fetched_users = await user_data_task
+        fetched_users = await asyncio.gather(*(fetch_user_data(user_id) for user_id, _ in raw_leaderboard))
         
-        for i, (user_id, xp) in enumerate(raw_leaderboard):
-            leaderboard_user_info = fetched_users[i]
+        for (user_id, xp), leaderboard_user_info in zip(raw_leaderboard, fetched_users):
             xp_leaderboard.append({
                 "name": leaderboard_user_info['name'],
                 "score": xp
@@ -213,10 +301,10 @@ async def panel_home(guild_id: int):
     return await render_template(
         "panel_dashboard.html",
         guild_id=guild_id, guild_name=guild.name, guild_icon_url=guild.icon.url if guild.icon else None,
-        user_name=session_user_info['name'], user_avatar_url=session_user_info['avatar_url'],
-        last_member=last_member_joined.display_name, online_count=online_members, member_count=true_member_count,
-        access_level=access_level,
-        is_developer=is_dev,
+        user_name=ctx.user_info['name'], user_avatar_url=ctx.user_info['avatar_url'],
+        last_member=last_member, online_count=online_members, member_count=true_member_count,
+        access_level=ctx.access_level,
+        is_developer=ctx.is_developer,
         xp_leaderboard=xp_leaderboard,
         csrf_token=session.get('csrf_token')
     )
@@ -225,22 +313,20 @@ async def panel_home(guild_id: int):
 @login_required
 async def panel_widgets(guild_id: int):
     """Renders the widgets page."""
-    guild = app.bot_instance.get_guild(guild_id)
-    user_id = int(session.get('user_id'))
-    user_info = await fetch_user_data(user_id)
-    access_level = await get_user_access_level(guild, user_id)
-    is_dev = await utils.is_developer(user_id)
+    ctx = await _panel_context(guild_id)
+    guild = ctx.guild
 
-    token = await database.get_or_create_widget_token(guild_id)
+    async with app.bot_instance.db_web_sem:
+        token = await database.get_or_create_widget_token(guild_id)
     widget_url_base = f"{APP_BASE_URL}/widget/view/{token}"
 
     return await render_template(
         "panel_widgets.html",
         guild_id=guild_id, guild_name=guild.name, guild_icon_url=guild.icon.url if guild.icon else None,
-        user_name=user_info['name'], user_avatar_url=user_info['avatar_url'],
+        user_name=ctx.user_info['name'], user_avatar_url=ctx.user_info['avatar_url'],
         regular_widget_url=f"{widget_url_base}?type=regular",
-        access_level=access_level,
-        is_developer=is_dev,
+        access_level=ctx.access_level,
+        is_developer=ctx.is_developer,
         csrf_token=session.get('csrf_token')
     )
 
@@ -248,31 +334,29 @@ async def panel_widgets(guild_id: int):
 @login_required
 async def panel_mod_menu(guild_id: int):
     """Renders the moderation menu page."""
-    guild = app.bot_instance.get_guild(guild_id)
-    user_id = int(session.get('user_id'))
-    user_info = await fetch_user_data(user_id)
-    access_level = await get_user_access_level(guild, user_id)
-    is_dev = await utils.is_developer(user_id)
+    ctx = await _panel_context(guild_id)
+    guild = ctx.guild
 
-    admin_role_ids = await utils.get_admin_roles(guild_id)
-    mod_role_ids = await utils.get_mod_roles(guild_id)
+    async with app.bot_instance.db_web_sem:
+        admin_role_ids = await utils.get_admin_roles(guild_id)
+        mod_role_ids = await utils.get_mod_roles(guild_id)
 
+    # One pass over the member list; Role.members would rescan the whole guild once per staff role.
     admin_members = []
     mod_members = []
     for member in guild.members:
         if member.bot: continue
-        member_role_ids = {role.id for role in member.roles}
-        if any(role_id in member_role_ids for role_id in admin_role_ids):
+        if not admin_role_ids.isdisjoint(role.id for role in member.roles):
             admin_members.append({"id": member.id, "name": member.display_name, "avatar_url": member.display_avatar.url})
-        elif any(role_id in member_role_ids for role_id in mod_role_ids):
+        elif not mod_role_ids.isdisjoint(role.id for role in member.roles):
             mod_members.append({"id": member.id, "name": member.display_name, "avatar_url": member.display_avatar.url})
 
     return await render_template(
         "panel_mod_menu.html",
         guild_id=guild_id, guild_name=guild.name, guild_icon_url=guild.icon.url if guild.icon else None,
-        user_name=user_info['name'], user_avatar_url=user_info['avatar_url'],
-        access_level=access_level,
-        is_developer=is_dev,
+        user_name=ctx.user_info['name'], user_avatar_url=ctx.user_info['avatar_url'],
+        access_level=ctx.access_level,
+        is_developer=ctx.is_developer,
         admin_members=admin_members,
         mod_members=mod_members,
         csrf_token=session.get('csrf_token')
@@ -294,15 +378,15 @@ async def api_moderate_user(guild_id: int):
 
     # Basic validation
     if not task['target_id'] or not task['mod_action']:
-        return jsonify({"error": "User ID and Action are required."}), 400
+        return _json({"error": "User ID and Action are required."}, 400)
 
     try:
         # Put the task into the bot's queue
         app.bot_instance.action_queue.put_nowait(task)
-        return jsonify({"message": f"Action '{task['mod_action'].capitalize()}' has been successfully queued."}), 200
+        return _json({"message": f"Action '{task['mod_action'].capitalize()}' has been successfully queued."})
     except Exception as e:
         log.error(f"Failed to queue moderation action: {e}")
-        return jsonify({"error": "Failed to queue the action. Please try again later."}), 500
+        return _json({"error": "Failed to queue the action. Please try again later."}, 500)
 
 @app.route('/login')
 async def login():
@@ -336,15 +420,13 @@ async def callback():
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(f"{DISCORD_API_BASE_URL}/oauth2/token", data=data, headers=headers)
+    token_response = await app.http_client.post(f"{DISCORD_API_BASE_URL}/oauth2/token", data=data, headers=headers)
     
     token_data = token_response.json()
     access_token = token_data.get("access_token")
 
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        user_response = await client.get(f"{DISCORD_API_BASE_URL}/users/@me", headers=headers)
+    user_response = await app.http_client.get(f"{DISCORD_API_BASE_URL}/users/@me", headers=headers)
     
     user_data = user_response.json()
     user_id = int(user_data['id'])
@@ -357,17 +439,18 @@ async def callback():
     if not member:
         return await render_template("access_denied.html", guild_name=guild.name)
 
-    is_staff = await utils.has_mod_role(member)
+    async with app.bot_instance.db_web_sem:
+        is_staff = await utils.has_mod_role(member)
 
     if not is_staff:
         return await render_template("access_denied.html", guild_name=guild.name)
 
     session['csrf_token'] = secrets.token_hex(32)
     session['user_id'] = user_data['id']
-    authorized_guilds = session.get('authorized_guilds', [])
-    if guild_id_to_check not in authorized_guilds:
-        authorized_guilds.append(guild_id_to_check)
-    session['authorized_guilds'] = authorized_guilds
+    # Sessions are JSON, so the set is stored as a list.
+    authorized_guilds = set(session.get('authorized_guilds') or ())
+    authorized_guilds.add(guild_id_to_check)
+    session['authorized_guilds'] = list(authorized_guilds)
     
     return redirect(url_for('panel_home', guild_id=guild_id_to_check))
 
@@ -375,28 +458,34 @@ async def callback():
 async def home():
     return "Web server for LeClark Bot is active."
 
+async def _cached_page_response(rendered: str, etag: str):
+    """Serves a cached page, or an empty 304 when the client already holds this version."""
+    # if_none_match parses comma-separated lists, W/ weak tags and '*'; If-None-Match uses weak comparison.
+    not_modified = request.if_none_match.contains_weak(etag)
+    response = await make_response('' if not_modified else rendered, 304 if not_modified else 200)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_EXPIRATION}'
+    return response
+
 @app.route('/leaderboard/<int:guild_id>')
 async def xp_leaderboard(guild_id: int):
     cache_key = f"leaderboard_{guild_id}"
-    current_time = time.time()
-    if cache_key in web_cache and (current_time - web_cache[cache_key]['timestamp']) < CACHE_EXPIRATION:
-        return web_cache[cache_key]['data']
+    if (cached := web_cache.get(cache_key)) is not None:
+        return await _cached_page_response(*cached)
         
     bot = app.bot_instance
     guild = bot.get_guild(guild_id)
     if not guild: 
         return await render_template("leaderboard.html", title="Error", guild_name="Unknown Server", users=[])
 
-    raw_leaderboard = await database.get_leaderboard(guild_id, limit=100)
+    async with bot.db_web_sem:
+        raw_leaderboard = await database.get_leaderboard(guild_id, limit=100)
     
     users = []
     if raw_leaderboard:
-        user_ids = [user_id for user_id, xp in raw_leaderboard]
-        user_data_task = asyncio.gather(*[fetch_user_data(uid) for uid in user_ids])
-        fetched_users = await user_data_task
+        fetched_users = await asyncio.gather(*(fetch_user_data(user_id) for user_id, _ in raw_leaderboard))
         
-        for i, (user_id, xp) in enumerate(raw_leaderboard):
-            user_info = fetched_users[i]
+        for (user_id, xp), user_info in zip(raw_leaderboard, fetched_users):
             rank_name, _, _ = get_rank_info(xp)
             users.append({
                 "name": user_info['name'],
@@ -415,16 +504,15 @@ async def xp_leaderboard(guild_id: int):
         score_name="XP"
     )
 
-    web_cache[cache_key] = {
-        'data': rendered_template,
-        'timestamp': current_time
-    }
+    etag = hashlib.md5(rendered_template.encode()).hexdigest()
+    web_cache[cache_key] = (rendered_template, etag)
     
-    return rendered_template
+    return await _cached_page_response(rendered_template, etag)
 
 @app.route('/widget/view/<token>')
 async def view_widget(token: str):
-    guild_id = await database.get_guild_from_token(token)
+    async with app.bot_instance.db_web_sem:
+        guild_id = await database.get_guild_from_token(token)
     if not guild_id:
         return "<h1>Invalid or expired token. Please regenerate your link.</h1>", 403
     return await render_template("widget.html", token=token)
@@ -436,14 +524,14 @@ async def websocket_endpoint():
     if not token:
         await ws_conn.close(1008, "Token is required"); return
 
-    guild_id = await database.get_guild_from_token(token)
+    async with app.bot_instance.db_web_sem:
+        guild_id = await database.get_guild_from_token(token)
     if not guild_id:
         await ws_conn.close(1008, "Invalid token"); return
 
-    await ws_manager.register(guild_id, ws_conn)
+    initial_data = await get_full_widget_data(guild_id, app.bot_instance.db_web_sem)
+    await ws_manager.register(guild_id, ws_conn, initial_data)
     try:
-        initial_data = await get_full_widget_data(guild_id)
-        await ws_conn.send(json.dumps(initial_data))
         while True:
             await ws_conn.receive()
     except asyncio.CancelledError:
@@ -457,24 +545,31 @@ async def callback_google():
     if not auth_code or not state: return "Error: Missing authorization code or state.", 400
     token_url = "https://oauth2.googleapis.com/token"
     token_params = {"client_id": GOOGLE_CLIENT_ID, "client_secret": GOOGLE_CLIENT_SECRET, "code": auth_code, "grant_type": "authorization_code", "redirect_uri": GOOGLE_REDIRECT_URI}
-    async with httpx.AsyncClient() as client: response = await client.post(token_url, data=token_params)
+    response = await app.http_client.post(token_url, data=token_params)
     token_data = response.json()
     if 'access_token' not in token_data: return "Error: Could not retrieve access token from Google.", 400
     access_token = token_data['access_token']
     user_url = "https://www.googleapis.com/oauth2/v2/userinfo"
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client: user_response = await client.get(user_url, headers=headers)
+    user_response = await app.http_client.get(user_url, headers=headers)
     user_data = user_response.json()
     if 'name' not in user_data: return "Error: Could not retrieve user data from Google.", 400
     account_name = user_data['name']
+    template_data = await get_verification_data(state)
     try:
-        template_data = await get_verification_data(state)
-        async with aiosqlite.connect(DB_FILE) as conn:
-            await conn.execute("UPDATE verification_links SET status = 'verified', verified_account = ? WHERE state = ? AND status = 'pending'", (account_name, state))
-            await conn.commit()
-        return await render_template("success.html", account_name=account_name, **template_data)
-    except Exception as e:
-        print(f"Database error during google callback: {e}"); return "An internal server error occurred.", 500
+        async with app.bot_instance.db_web_sem:
+            await database.complete_verification(state, account_name)
+    except Exception:
+        log.exception("Database error during google callback")
+        return "An internal server error occurred.", 500
+    return await render_template("success.html", account_name=account_name, **template_data)
+
+# setup_type -> (channel setting, cog that posts the panel, channel name used in errors)
+SETUP_HANDLERS = {
+    'verification': ('verification_channel_id', "Verification", "Verification"),
+    'submission': ('review_channel_id', "Submissions", "Review"),
+    'role_giver': ('role_giver_channel_id', "Role Giver", "Role Giver"),
+}
 
 @app.route('/api/v1/actions/run-setup/<int:guild_id>', methods=['POST'])
 @login_required
@@ -486,43 +581,35 @@ async def api_run_setup(guild_id: int):
     guild = bot.get_guild(guild_id)
     
     if not guild:
-        return jsonify({"error": "Bot could not find this guild."}), 404
+        return _json({"error": "Bot could not find this guild."}, 404)
     
     moderator = guild.get_member(int(session.get('user_id')))
-    if not moderator or not await utils.has_admin_role(moderator):
-        return jsonify({"error": "You must be a Bot Admin to perform this action."}), 403
-
-    if setup_type == 'verification':
-        channel_id = await database.get_setting(guild.id, 'verification_channel_id')
-        cog = bot.get_cog("Verification")
-        if not channel_id: return jsonify({"error": "Verification channel not set in bot settings."}), 400
-        if not cog: return jsonify({"error": "Verification cog not found."}), 500
-        
-    elif setup_type == 'submission':
-        channel_id = await database.get_setting(guild.id, 'review_channel_id')
-        cog = bot.get_cog("Submissions")
-        if not channel_id: return jsonify({"error": "Review channel not set in bot settings."}), 400
-        if not cog: return jsonify({"error": "Submissions cog not found."}), 500
-
-    elif setup_type == 'role_giver':
-        channel_id = await database.get_setting(guild.id, 'role_giver_channel_id')
-        cog = bot.get_cog("Role Giver")
-        if not channel_id: return jsonify({"error": "Role Giver channel not set in bot settings."}), 400
-        if not cog: return jsonify({"error": "Role Giver cog not found."}), 500
-        
-    else:
-        return jsonify({"error": "Invalid setup type."}), 400
+    async with bot.db_web_sem:
+        is_admin = moderator is not None and await utils.has_admin_role(moderator)
+    if not is_admin:
+        return _json({"error": "You must be a Bot Admin to perform this action."}, 403)
+
+    handler = SETUP_HANDLERS.get(setup_type)
+    if not handler:
+        return _json({"error": "Invalid setup type."}, 400)
+    setting_key, cog_name, channel_label = handler
+
+    async with bot.db_web_sem:
+        channel_id = await database.get_setting(guild.id, setting_key)
+    cog = bot.get_cog(cog_name)
+    if not channel_id: return _json({"error": f"{channel_label} channel not set in bot settings."}, 400)
+    if not cog: return _json({"error": f"{cog_name} cog not found."}, 500)
 
     channel = guild.get_channel(channel_id)
     if not channel:
-        return jsonify({"error": "The configured channel was not found."}), 404
+        return _json({"error": "The configured channel was not found."}, 404)
     
     success, message = await cog.post_panel(channel)
     
     if success:
-        return jsonify({"message": message}), 200
+        return _json({"message": message})
     else:
-        return jsonify({"error": message}), 500
+        return _json({"error": message}, 500)
 
 @app.route('/api/v1/actions/send-message/<int:guild_id>', methods=['POST'])
 @login_required
@@ -537,15 +624,18 @@ async def api_send_message(guild_id: int):
         "is_embed": form.get('is_embed') == 'true'
     }
     if not task['channel_id'] or not task['content']:
-        return jsonify({"error": "Channel ID and Content are required."}), 400
+        return _json({"error": "Channel ID and Content are required."}, 400)
 
     app.bot_instance.action_queue.put_nowait(task)
-    return jsonify({"message": "Message queued successfully."}), 200
+    return _json({"message": "Message queued successfully."})
 
 @app.route('/api/v1/audit-log/<int:guild_id>')
 @login_required
 async def api_get_audit_log(guild_id: int):
     """API endpoint to fetch the audit log."""
+    audit_log_cache = app.bot_instance.audit_log_cache
+    if (cached := audit_log_cache.get(guild_id)) is not None:
+        return Response(cached, mimetype='application/json')
     guild = app.bot_instance.get_guild(guild_id)
     logs = []
     try:
@@ -556,12 +646,14 @@ async def api_get_audit_log(guild_id: int):
                 "target": str(entry.target) if entry.target else "N/A",
                 "reason": str(entry.reason) if entry.reason else "No reason provided."
             })
-        return jsonify(logs)
+        payload = orjson.dumps(logs)
+        audit_log_cache[guild_id] = payload
+        return Response(payload, mimetype='application/json')
     except discord.Forbidden:
-        return jsonify({"error": "Bot lacks permission to view audit logs."}), 403
+        return _json({"error": "Bot lacks permission to view audit logs."}, 403)
     except Exception as e:
         log.error(f"Failed to fetch audit log for guild {guild_id}: {e}")
-        return jsonify({"error": "An internal error occurred."}), 500
+        return _json({"error": "An internal error occurred."}, 500)
     
 @app.route('/api/v1/actions/manage-staff/<int:guild_id>', methods=['POST'])
 @login_required
@@ -571,8 +663,10 @@ async def api_manage_staff(guild_id: int):
     # Ensure the user making the request is an Admin
     guild = app.bot_instance.get_guild(guild_id)
     moderator = guild.get_member(int(session.get('user_id')))
-    if not await utils.has_admin_role(moderator):
-        return jsonify({"error": "You must be a Bot Admin to perform this action."}), 403
+    async with app.bot_instance.db_web_sem:
+        is_admin = await utils.has_admin_role(moderator)
+    if not is_admin:
+        return _json({"error": "You must be a Bot Admin to perform this action."}, 403)
 
     task = {
         "action": "manage_staff",
@@ -584,10 +678,10 @@ async def api_manage_staff(guild_id: int):
     }
 
     if not all(k in task for k in ['target_id', 'role_type', 'role_action']):
-        return jsonify({"error": "Missing required fields."}), 400
+        return _json({"error": "Missing required fields."}, 400)
 
     app.bot_instance.action_queue.put_nowait(task)
-    return jsonify({"message": f"Staff role {task['role_action']} action queued successfully."}), 200
+    return _json({"message": f"Staff role {task['role_action']} action queued successfully."})
 
 @app.route('/api/v1/search-members/<int:guild_id>')
 @login_required
@@ -595,11 +689,11 @@ async def api_search_members(guild_id: int):
     """API endpoint to search for guild members."""
     query = request.args.get('q', '').lower()
     if not query or len(query) < 2:
-        return jsonify([])
+        return _json([])
 
     guild = app.bot_instance.get_guild(guild_id)
     if not guild:
-        return jsonify({"error": "Guild not found"}), 404
+        return _json({"error": "Guild not found"}, 404)
 
     results = []
     for member in guild.members:
@@ -619,7 +713,7 @@ async def api_search_members(guild_id: int):
         if len(results) >= 10:
             break
             
-    return jsonify(results)
+    return _json(results)
 
 @app.route('/api/v1/get-channels/<int:guild_id>')
 @login_required
@@ -627,12 +721,12 @@ async def api_get_channels(guild_id: int):
     """API endpoint to get a list of text channels."""
     guild = app.bot_instance.get_guild(guild_id)
     if not guild:
-        return jsonify({"error": "Guild not found"}), 404
+        return _json({"error": "Guild not found"}, 404)
 
     user_id = int(session.get('user_id'))
     member = guild.get_member(user_id)
     if not member:
-         return jsonify({"error": "Could not find your user in the guild"}), 403
+         return _json({"error": "Could not find your user in the guild"}, 403)
 
     results = []
     sorted_channels = sorted(guild.text_channels, key=lambda c: (c.category.position if c.category else -1, c.position))
@@ -650,7 +744,7 @@ async def api_get_channels(guild_id: int):
                 "category": channel.category.name if channel.category else "Text Channels"
             })
             
-    return jsonify(results)
+    return _json(results)
 
 @app.route('/api/v1/actions/reset-stuck-review/<int:guild_id>', methods=['POST'])
 @login_required
@@ -662,4 +756,4 @@ async def api_reset_stuck_review(guild_id: int):
         "moderator_id": int(session.get('user_id')),
     }
     app.bot_instance.action_queue.put_nowait(task)
-    return jsonify({"message": "Reset command queued successfully."}), 200
\ No newline at end of file
+    return _json({"message": "Reset command queued successfully."})
\ No newline at end of file